@@ -2,7 +2,7 @@
 import streamlit as st
 import requests
 from PIL import Image
-import os, io
+import os, io, uuid, time
 import pandas as pd
 import numpy as np
 
@@ -83,18 +83,79 @@ st.markdown("<div class='title'>🌾 AI Smart Farming Assistant — Kerala</div>
 st.markdown("<div class='subtitle'>Localized crop advice, disease detection, weather & market tips.</div>", unsafe_allow_html=True)
 
 # ---------------- Helper ----------------
-def safe_request(method, path, json=None, files=None, timeout=10):
+def client_headers():
+    # the backend rate-limits per farmer, not per Streamlit server: pass on the
+    # browser's IP when Streamlit knows it, plus a per-session id as fallback
+    headers = {"X-Session-Id": st.session_state.setdefault("session_id", uuid.uuid4().hex)}
+    ip = getattr(getattr(st, "context", None), "ip_address", None)
+    if ip:
+        headers["X-Forwarded-For"] = ip
+    return headers
+
+def safe_request(method, path, json=None, files=None, data=None, timeout=10):
     try:
         url = BACKEND_URL.rstrip("/") + path
+        headers = client_headers()
         if method == "POST":
             if files:
-                return requests.post(url, files=files, timeout=timeout)
-            return requests.post(url, json=json, timeout=timeout)
+                r = requests.post(url, files=files, data=data, headers=headers, timeout=timeout)
+            else:
+                r = requests.post(url, json=json, headers=headers, timeout=timeout)
         else:  # GET
-            return requests.get(url, params=json, timeout=timeout)
+            r = requests.get(url, params=json, headers=headers, timeout=timeout)
     except Exception as e:
         st.error(f"Network error: {e}")
         return None
+    # every backend response names the current catalogue version
+    version = r.headers.get("X-Catalogue-Version")
+    cache = catalogue_cache()
+    if version and cache["version"] and version != cache["version"]:
+        cache["stale"] = True
+    return r
+
+# ---------------- Catalogue cache ----------------
+CATALOGUE_MAX_AGE = 24 * 3600  # matches the backend's Cache-Control max-age
+
+@st.cache_resource
+def catalogue_cache():
+    # shared by all sessions of this Streamlit server
+    return {"etag": None, "version": None, "data": None, "fetched_at": 0.0, "stale": True}
+
+def get_catalogue():
+    """Static crops/diseases/tips/fertilizer data, downloaded once and revalidated with If-None-Match."""
+    cache = catalogue_cache()
+    expired = time.time() - cache["fetched_at"] > CATALOGUE_MAX_AGE
+    if cache["data"] is None or cache["stale"] or expired:
+        headers = client_headers()
+        if cache["etag"] and cache["data"] is not None:
+            headers["If-None-Match"] = cache["etag"]
+        try:
+            r = requests.get(BACKEND_URL.rstrip("/") + "/catalogue", headers=headers, timeout=10)
+        except Exception:
+            return cache["data"]  # keep serving the last copy while offline
+        if r.status_code == 200:
+            cache.update(etag=r.headers.get("ETag"), version=r.headers.get("X-Catalogue-Version"),
+                         data=r.json(), fetched_at=time.time(), stale=False)
+        elif r.status_code == 304:
+            cache.update(fetched_at=time.time(), stale=False)
+    return cache["data"]
+
+def show_busy(r):
+    # backend sheds load with 429/503 + Retry-After
+    if r is not None and r.status_code in (429, 503):
+        st.warning(f"⏳ Server busy, please retry in {r.headers.get('Retry-After', 'a few')} seconds.")
+        return True
+    return False
+
+def rgb_thumbnail(img_file, size=128):
+    img_file.seek(0)
+    return np.asarray(Image.open(img_file).convert("RGB").resize((size, size)))
+
+def rgb_histogram_bytes(img_file, size=128):
+    # 8x8x8 RGB histogram of a small thumbnail, same binning as the backend
+    arr = rgb_thumbnail(img_file, size) >> 5
+    idx = arr[..., 0].astype(np.int32) * 64 + arr[..., 1] * 8 + arr[..., 2]
+    return np.bincount(idx.ravel(), minlength=512).astype("<f4").tobytes()
 
 # ---------------- MAIN CONTENT ----------------
 left, right = st.columns([2.2, 1])
@@ -103,7 +164,9 @@ with left:
     st.markdown("<div class='card'>", unsafe_allow_html=True)
 
     if menu.startswith("Crop Recommendation"):
-        soil = st.selectbox("Choose soil type / മണ്ണ്", ["loamy","clayey","sandy","laterite","black","red","alluvial","desert","mountain"])
+        cat = get_catalogue()
+        soils = list(cat["crops"]) if cat else ["loamy","clayey","sandy","laterite","black","red","alluvial","desert","mountain"]
+        soil = st.selectbox("Choose soil type / മണ്ണ്", soils)
         rainfall = st.number_input("Rainfall (mm) / മഴ (mm)", min_value=0, value=1100)
         season = st.selectbox("Season / സീസൺ", ["monsoon","summer","winter"])
         if st.button("Get Crop Recommendation"):
@@ -125,11 +188,21 @@ with left:
     elif menu.startswith("Disease Help"):
         st.markdown("#### 🦠 Upload crop leaf image for disease detection")
         img_file = st.file_uploader("Upload an image", type=["jpg", "jpeg", "png"])
+        # off by default: the 2 KB summary is a cruder match than the full photo
+        low_bandwidth = st.checkbox("📶 Low-bandwidth mode (sends a 2 KB colour summary)", value=False)
 
         if st.button("Analyze Disease") and img_file:
-            files = {"file": (img_file.name, img_file.getvalue(), img_file.type)}
-            # ✅ fixed endpoint name
-            r = safe_request("POST", "/detect_disease", files=files)
+            if low_bandwidth:
+                files = {"file": ("hist.bin", rgb_histogram_bytes(img_file), "application/octet-stream")}
+                r = safe_request("POST", "/detect_disease_compact", files=files, data={"kind": "hist"})
+                if r is not None and r.status_code == 400:
+                    # backend descriptor can't use client histograms; send the raw thumbnail instead
+                    files = {"file": ("thumb.rgb", rgb_thumbnail(img_file).tobytes(), "application/octet-stream")}
+                    r = safe_request("POST", "/detect_disease_compact", files=files, data={"kind": "thumb"})
+            else:
+                files = {"file": (img_file.name, img_file.getvalue(), img_file.type)}
+                # ✅ fixed endpoint name
+                r = safe_request("POST", "/detect_disease", files=files)
             if r and r.status_code == 200:
                 data = r.json()
                 if "disease_detected" in data:
@@ -139,12 +212,15 @@ with left:
                     st.error(data["error"])
                 else:
                     st.error("Unexpected response from backend.")
-            else:
+            elif not show_busy(r):
                 st.error("Failed to analyze disease.")
 
     elif menu.startswith("Fertilizer Advisor"):
-        crop = st.selectbox("Crop / വിള", ["rice","banana","coconut","groundnut"])
-        stage = st.selectbox("Stage / ഘട്ടം", ["seedling","vegetative","flowering"])
+        cat = get_catalogue()
+        crops = list(cat["fertilizer"]) if cat else ["rice","banana","coconut","groundnut"]
+        crop = st.selectbox("Crop / വിള", crops)
+        stages = list(cat["fertilizer"][crop]) if cat else ["seedling","vegetative","flowering"]
+        stage = st.selectbox("Stage / ഘട്ടം", stages)
         soil_n = st.number_input("Soil N (ppm)", min_value=0, value=100)
         soil_p = st.number_input("Soil P (ppm)", min_value=0, value=30)
         soil_k = st.number_input("Soil K (ppm)", min_value=0, value=80)
@@ -196,7 +272,7 @@ with left:
                             if link:
                                 st.markdown(f"[Read more]({link})")
                             st.json(a)
-            else:
+            elif not show_busy(r):
                 st.error("Failed to fetch pest alerts.")
 
     elif menu.startswith("Voice Assistant"):
@@ -0,0 +1,115 @@
+# Backend/bench_descriptors.py
+# Compare matching accuracy and extraction latency of the "rgb" and "leaf"
+# descriptors on a labelled local test set.
+#
+# Test set layout: one sub-folder per disease key, e.g.
+#   test_images/leaf_blight/img001.jpg
+#   test_images/rust/field_03.png
+#
+# Usage: python bench_descriptors.py test_images [--ref-dir reference_diseases]
+import argparse
+import os
+import time
+import numpy as np
+
+try:
+    from .descriptors import (DESCRIPTORS, DESCRIPTOR_BUDGET_MS, INDEX_DTYPES, compute_descriptor,
+                              correlation_matrix, correlation_scores, read_image_cv)
+except ImportError:
+    from descriptors import (DESCRIPTORS, DESCRIPTOR_BUDGET_MS, INDEX_DTYPES, compute_descriptor,
+                             correlation_matrix, correlation_scores, read_image_cv)
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+def load_reference(ref_dir):
+    refs = {}
+    for fname in sorted(os.listdir(ref_dir)):
+        if fname.lower().endswith(IMAGE_EXTS):
+            img = read_image_cv(os.path.join(ref_dir, fname))
+            if img is not None:
+                refs[os.path.splitext(fname)[0].lower()] = img
+    return refs
+
+def load_test_set(test_dir):
+    samples = []
+    for label in sorted(os.listdir(test_dir)):
+        folder = os.path.join(test_dir, label)
+        if not os.path.isdir(folder):
+            continue
+        for fname in sorted(os.listdir(folder)):
+            if fname.lower().endswith(IMAGE_EXTS):
+                img = read_image_cv(os.path.join(folder, fname))
+                if img is not None:
+                    samples.append((label.lower(), img))
+    return samples
+
+def run(kind, refs, samples, min_score, repeat):
+    keys = tuple(refs)
+    matrix = correlation_matrix([compute_descriptor(refs[k], kind) for k in keys], INDEX_DTYPES[kind])
+    compute_descriptor(samples[0][1], kind)  # warm up OpenCV before timing
+
+    times_ms, correct, accepted, correct_accepted = [], 0, 0, 0
+    for label, img in samples:
+        desc = compute_descriptor(img, kind)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            compute_descriptor(img, kind)
+            times_ms.append((time.perf_counter() - start) * 1000)
+        scores = correlation_scores(matrix, desc)
+        best = int(np.argmax(scores))
+        hit = keys[best] == label
+        correct += hit
+        if scores[best] >= min_score:
+            accepted += 1
+            correct_accepted += hit
+
+    n = len(samples)
+    t = np.array(times_ms)
+    return {
+        "descriptor": kind,
+        "top1": correct / n,
+        "accepted": accepted / n,
+        "precision@min_score": correct_accepted / accepted if accepted else 0.0,
+        "mean_ms": float(t.mean()),
+        "p95_ms": float(np.percentile(t, 95)),
+        "max_ms": float(t.max()),
+        "over_budget": int((t > DESCRIPTOR_BUDGET_MS).sum()),
+        "dims": int(matrix.shape[1]),
+        "bytes": int(matrix.nbytes),
+    }
+
+def positive_int(value):
+    n = int(value)
+    if n < 1:
+        raise argparse.ArgumentTypeError("must be >= 1")
+    return n
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Compare rgb vs leaf descriptors.")
+    parser.add_argument("test_dir", help="folder with one sub-folder of images per disease key")
+    parser.add_argument("--ref-dir", default=os.path.join(here, "reference_diseases"))
+    parser.add_argument("--min-score", type=float, default=0.15, help="server MIN_SCORE threshold")
+    parser.add_argument("--repeat", type=positive_int, default=3, help="timing repetitions per image")
+    args = parser.parse_args()
+
+    refs = load_reference(args.ref_dir)
+    samples = load_test_set(args.test_dir)
+    if not refs or not samples:
+        raise SystemExit(f"Need reference images in {args.ref_dir} and labelled images in {args.test_dir}.")
+    unknown = sorted({label for label, _ in samples} - set(refs))
+    if unknown:
+        print(f"warning: test labels with no reference image (always wrong): {unknown}")
+
+    print(f"{len(refs)} references, {len(samples)} test images, budget {DESCRIPTOR_BUDGET_MS} ms/image\n")
+    header = f"{'descriptor':<10} {'top1':>6} {'accept':>7} {'prec':>6} {'mean ms':>8} {'p95 ms':>7} {'max ms':>7} {'>budget':>8} {'dims':>5} {'index B':>8}"
+    print(header)
+    print("-" * len(header))
+    for kind in DESCRIPTORS:
+        r = run(kind, refs, samples, args.min_score, args.repeat)
+        print(f"{r['descriptor']:<10} {r['top1']:>6.1%} {r['accepted']:>7.1%} {r['precision@min_score']:>6.1%} "
+              f"{r['mean_ms']:>8.2f} {r['p95_ms']:>7.2f} {r['max_ms']:>7.2f} {r['over_budget']:>8} "
+              f"{r['dims']:>5} {r['bytes']:>8}")
+
+if __name__ == "__main__":
+    main()
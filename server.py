@@ -5,13 +5,23 @@ from pydantic import BaseModel
 from typing import Optional
 import random
 import datetime
+import gzip
+import hashlib
+import json
 import logging
+import math
 import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 import cv2
 import numpy as np
-from fastapi import UploadFile, File, HTTPException
+from fastapi import Depends, UploadFile, File, Form, HTTPException, Request, Response
 from fastapi.responses import JSONResponse
 from .disease_model import predict_disease
+from .descriptors import (DESCRIPTORS, DESCRIPTOR_BUDGET_MS, INDEX_DTYPES, compute_descriptor,
+                          correlation_matrix, correlation_scores, read_image_cv)
 
 
 # --- pest alerts import (try relative, then absolute, else fallback stub) ---
@@ -29,54 +39,157 @@ except Exception:
             return []
 
 # ---------------- APP ----------------
-app = FastAPI(title="🌾 Smart Farming Assistant / സ്മാർട്ട് ഫാർമിംഗ് അസിസ്റ്റന്റ്")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # poll reference_diseases/ for the life of the server (see watch_reference_dir)
+    stop = threading.Event()
+    threading.Thread(target=watch_reference_dir, args=(stop,),
+                     name="reference-watcher", daemon=True).start()
+    yield
+    stop.set()
 
-# allow Streamlit (frontend) to call backend
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # allow all during dev
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+app = FastAPI(title="🌾 Smart Farming Assistant / സ്മാർട്ട് ഫാർമിംഗ് അസിസ്റ്റന്റ്", lifespan=lifespan)
 
 # ---------------- Reference images (for histogram matching) ----------------
 # Use path relative to this file
 REFERENCE_DIR = os.path.join(os.path.dirname(__file__), "reference_diseases")
-# Build reference histograms only if folder exists
-def compute_histogram_cv(img_rgb):
-    # img_rgb: RGB numpy array HxWx3
-    hist = cv2.calcHist([img_rgb], [0, 1, 2], None, [8, 8, 8], [0,256,0,256,0,256])
-    cv2.normalize(hist, hist)
-    return hist.flatten()
-
-def read_image_cv(path):
-    # Better robust read across platforms
-    try:
-        data = np.fromfile(path, dtype=np.uint8)
-        img = cv2.imdecode(data, cv2.IMREAD_COLOR)
-        if img is None:
-            return None
-        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    except Exception:
-        return None
-
-def compare_histograms(h1, h2):
-    # use correlation: higher = more similar (1.0 perfect)
-    try:
-        return float(cv2.compareHist(h1.astype('float32'), h2.astype('float32'), cv2.HISTCMP_CORREL))
-    except Exception:
-        return -1.0
-
-ref_histograms = {}
-if os.path.isdir(REFERENCE_DIR):
-    for fname in os.listdir(REFERENCE_DIR):
-        if fname.lower().endswith((".jpg", ".jpeg", ".png")):
-            key = os.path.splitext(fname)[0].lower()
+# Descriptor used for matching: "rgb" (8x8x8 RGB histogram, the original)
+# or "leaf" (leaf-masked HSV + Lab histograms, see descriptors.py).
+DISEASE_DESCRIPTOR = os.getenv("DISEASE_DESCRIPTOR", "rgb").lower()
+if DISEASE_DESCRIPTOR not in DESCRIPTORS:
+    logging.warning(f"Unknown DISEASE_DESCRIPTOR '{DISEASE_DESCRIPTOR}', using 'rgb'.")
+    DISEASE_DESCRIPTOR = "rgb"
+
+# extraction time is tracked against DESCRIPTOR_BUDGET_MS for monitoring only
+descriptor_stats = {"kind": DISEASE_DESCRIPTOR, "budget_ms": DESCRIPTOR_BUDGET_MS,
+                    "count": 0, "last_ms": 0.0, "max_ms": 0.0, "over_budget": 0}
+
+def describe(img_rgb):
+    start = time.perf_counter()
+    desc = compute_descriptor(img_rgb, DISEASE_DESCRIPTOR)
+    ms = (time.perf_counter() - start) * 1000
+    descriptor_stats["count"] += 1
+    descriptor_stats["last_ms"] = round(ms, 3)
+    descriptor_stats["max_ms"] = round(max(descriptor_stats["max_ms"], ms), 3)
+    if ms > DESCRIPTOR_BUDGET_MS:
+        descriptor_stats["over_budget"] += 1
+    return desc
+
+# ---------------- Reference index (hot reload) ----------------
+# `ref_index` bundles everything matching and /admin/reference_index read:
+# keys, the correlation matrix, the key -> descriptor map and its
+# generation info. It is never mutated in place: refresh_reference_index()
+# copies the parts, applies only the files that were added/changed/removed,
+# and rebinds `ref_index` in a single assignment, so a request that reads
+# it once keeps a consistent snapshot.
+REFERENCE_EXTS = (".jpg", ".jpeg", ".png")
+REFERENCE_POLL_SECONDS = float(os.getenv("REFERENCE_POLL_SECONDS", "5"))
+
+ref_index = {
+    "keys": (),
+    "matrix": np.zeros((0, 0), dtype=INDEX_DTYPES[DISEASE_DESCRIPTOR]),
+    "histograms": {},
+    "generation": 0,
+    "updated_at": None,
+    "last_changes": {},
+}
+# writer-side state, only touched under _ref_index_lock
+ref_files = {}          # fname -> ((mtime_ns, size), descriptor) of the last good read
+ref_failed = {}         # fname -> (mtime_ns, size) of a read that failed; retried once that changes
+_ref_index_lock = threading.Lock()  # serialises writers only; readers never lock
+
+def reference_key(fname):
+    return os.path.splitext(fname)[0].lower()
+
+def scan_reference_dir():
+    files = {}
+    if not os.path.isdir(REFERENCE_DIR):
+        return files
+    with os.scandir(REFERENCE_DIR) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.lower().endswith(REFERENCE_EXTS):
+                st = entry.stat()
+                files[entry.name] = (st.st_mtime_ns, st.st_size)
+    return files
+
+def refresh_reference_index():
+    """Re-histogram only changed reference files and swap the index in. Returns the change counts."""
+    global ref_index, ref_files, ref_failed
+    with _ref_index_lock:
+        current = scan_reference_dir()
+        added = [f for f in current if f not in ref_files]
+        modified = [f for f in current if f in ref_files and current[f] != ref_files[f][0]]
+        removed = [f for f in ref_files if f not in current]
+        changes = {"added": 0, "modified": 0, "removed": len(removed), "unreadable": 0}
+
+        new_files = dict(ref_files)
+        new_failed = {f: stat for f, stat in ref_failed.items() if current.get(f) == stat}
+        for fname in removed:
+            del new_files[fname]
+        for fname in added + modified:
+            if fname in new_failed:
+                continue  # same bytes that failed last time, don't decode again
             img_rgb = read_image_cv(os.path.join(REFERENCE_DIR, fname))
             if img_rgb is None:
+                # half-written or unreadable: an added file stays out, a modified
+                # one keeps its last good descriptor; retried when its stat changes
+                new_failed[fname] = current[fname]
+                changes["unreadable"] += 1
                 continue
-            ref_histograms[key] = compute_histogram_cv(img_rgb)
+            new_files[fname] = (current[fname], compute_descriptor(img_rgb, DISEASE_DESCRIPTOR))
+            changes["added" if fname in added else "modified"] += 1
+        ref_failed = new_failed
+        touched = [f for f in added + modified if f not in new_failed] + removed
+        if not touched:
+            return changes
+
+        # several files can share a key (rust.jpg + rust.png), so rebuild
+        # each touched key from whatever files for it remain; first by name wins
+        new_hists = dict(ref_index["histograms"])
+        for key in {reference_key(f) for f in touched}:
+            sources = sorted(f for f in new_files if reference_key(f) == key)
+            if sources:
+                new_hists[key] = new_files[sources[0]][1]
+            else:
+                new_hists.pop(key, None)
+
+        keys = tuple(new_hists)
+        matrix = (correlation_matrix([new_hists[k] for k in keys], INDEX_DTYPES[DISEASE_DESCRIPTOR])
+                  if keys else ref_index["matrix"][:0])
+        ref_files = new_files
+        ref_index = {
+            "keys": keys,
+            "matrix": matrix,
+            "histograms": new_hists,
+            "generation": ref_index["generation"] + 1,
+            "updated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "last_changes": changes,
+        }
+        return changes
+
+def reference_index_info(index):
+    """The JSON-safe part of a ref_index snapshot."""
+    return {
+        "generation": index["generation"],
+        "updated_at": index["updated_at"],
+        "last_changes": index["last_changes"],
+        "size": len(index["keys"]),
+    }
+
+def watch_reference_dir(stop: threading.Event):
+    while not stop.wait(REFERENCE_POLL_SECONDS):
+        try:
+            changes = refresh_reference_index()
+            if changes["added"] or changes["modified"] or changes["removed"]:
+                logging.info(f"Reference index updated {changes}, generation {ref_index['generation']}")
+            if changes["unreadable"]:
+                logging.warning(f"{changes['unreadable']} reference image(s) unreadable, "
+                                f"will retry when they change")
+        except Exception as e:
+            logging.warning(f"Reference index refresh failed: {e}")
+
+if os.path.isdir(REFERENCE_DIR):
+    refresh_reference_index()
 else:
     logging.warning(f"Reference images folder not found: {REFERENCE_DIR}")
 
@@ -149,6 +262,313 @@ fertilizer_recommendations = {
                   "flowering": {"N": 60, "P": 80, "K": 60}}
 }
 
+# ---------------- STATIC CATALOGUE (versioned, cacheable) ----------------
+# The datasets above never change while the server runs, so serialize them
+# once at import and hand out the same bytes with a content-hash ETag.
+# Clients on slow links download /catalogue once and revalidate with
+# If-None-Match afterwards (304, empty body).
+CATALOGUE_MAX_AGE = 24 * 3600  # seconds clients may reuse without revalidating
+
+def _content_hash(obj):
+    raw = json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+def build_catalogue():
+    sections = {
+        "crops": crops_data,
+        "diseases": disease_data,
+        "weather_tips": weather_tips,
+        "fertilizer": fertilizer_recommendations,
+    }
+    versions = {name: _content_hash(data) for name, data in sections.items()}
+    version = _content_hash(versions)
+    payload = {"version": version, "sections": versions, **sections}
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return {
+        "version": version,
+        "sections": versions,
+        # each content-coding is its own representation, so it gets its own strong tag
+        "etag": f'"{version}"',
+        "etag_gzip": f'"{version}-gz"',
+        "body": body,
+        "body_gzip": gzip.compress(body, compresslevel=9),
+    }
+
+catalogue = build_catalogue()
+
+def etag_matches(request: Request, *etags: str) -> bool:
+    # If-None-Match may carry several tags, weak validators, or "*"
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or any(etag in tags or f"W/{etag}" in tags for etag in etags)
+
+def cached_json(request: Request, payload, max_age: int, etag: Optional[str] = None):
+    """Return `payload` as JSON with ETag/Cache-Control, or an empty 304 if the client copy is current."""
+    if etag is None:
+        etag = f'"{_content_hash(payload)}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={max_age}"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=payload, headers=headers)
+
+def seconds_until_midnight(now: Optional[datetime.datetime] = None) -> int:
+    now = now or datetime.datetime.now()
+    tomorrow = (now + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(1, int((tomorrow - now).total_seconds()))
+
+# ---------------- DISEASE MATCHING ----------------
+MIN_SCORE = 0.15  # threshold check - adjust 0.15 if too strict/lenient
+
+def best_reference_match(upload_hist):
+    """Best (key, score) among the current reference descriptors (correlation, 1.0 = perfect)."""
+    # take one snapshot; the watcher may swap in a new index meanwhile
+    index = ref_index
+    keys, matrix = index["keys"], index["matrix"]
+    if not keys:
+        return None, -1.0
+    scores = correlation_scores(matrix, upload_hist)
+    best = int(np.argmax(scores))
+    return keys[best], float(scores[best])
+
+def disease_result(best_key, best_score):
+    if best_key is None or best_score < MIN_SCORE:
+        return {"error": "No close disease match found.", "score": float(best_score)}
+
+    # find remedy in the disease_data dictionary
+    remedy = disease_data.get(best_key)
+    if not remedy:
+        # helpful response when a match was found but no remedy recorded
+        return {
+            "error": "Matched image found but remedy missing for key.",
+            "matched_key": best_key,
+            "score": float(best_score),
+            "note": "Use /admin/reference_index to inspect keys and /add_remedy to add remedy for this key."
+        }
+
+    # success
+    return {"disease_detected": best_key, "remedy": remedy, "score": float(best_score)}
+
+# ---------------- COMPACT UPLOADS ----------------
+# /detect_disease_compact takes either a raw THUMB_SIZE x THUMB_SIZE RGB
+# thumbnail or the 512-bin (8x8x8) RGB histogram already computed by the
+# client. Both have a fixed byte size, so the payload is checked by length
+# first and then read once into a numpy array and histogrammed in place.
+THUMB_SIZE = 128
+THUMB_BYTES = THUMB_SIZE * THUMB_SIZE * 3          # uint8 RGB, row-major
+HIST_BINS = 8 * 8 * 8
+HIST_BYTES = HIST_BINS * 4                         # little-endian float32
+COMPACT_KINDS = {"thumb": THUMB_BYTES, "hist": HIST_BYTES}
+COMPACT_MAX_BODY_BYTES = 64 * 1024                 # multipart overhead included
+
+# payload_bytes_est counts only the payload-sized buffers we hold (the
+# spooled upload, our one copy of it, the resulting histogram). It is an estimate, not a
+# measurement: multipart parser buffers and OpenCV scratch arrays are not included.
+upload_stats = {
+    "requests": 0,
+    "rejected_too_large": 0,
+    "rejected_no_length": 0,
+    "last_payload_bytes_est": 0,
+    "max_payload_bytes_est": 0,
+}
+
+def upload_size(upload: UploadFile) -> int:
+    f = upload.file
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(0)
+    return size
+
+def read_upload(upload: UploadFile, size: int):
+    """
+    Read the upload once into a preallocated uint8 array (one payload-sized
+    copy, at most 48 KB here) using only the public file API.
+    """
+    arr = np.empty(size, dtype=np.uint8)
+    upload.file.seek(0)
+    if upload.file.readinto(memoryview(arr)) != size:
+        raise ValueError("short read from upload")
+    return arr
+
+def histogram_from_compact(kind, buf):
+    if kind == "thumb":
+        thumb = buf.reshape(THUMB_SIZE, THUMB_SIZE, 3)  # view, no copy
+        return describe(thumb)
+    if DISEASE_DESCRIPTOR != "rgb":
+        raise ValueError(f"client histograms need the 'rgb' descriptor; server uses '{DISEASE_DESCRIPTOR}', send kind=thumb")
+    hist = buf.view("<f4")
+    if not np.all(np.isfinite(hist)) or np.any(hist < 0):
+        raise ValueError("histogram must contain finite, non-negative values")
+    norm = float(np.linalg.norm(hist))
+    if norm == 0.0:
+        raise ValueError("histogram is empty")
+    # same L2 normalisation cv2.normalize applies in compute_histogram_cv
+    return (hist / norm).astype(np.float32)
+
+# ---------------- LOAD PROTECTION ----------------
+# Every request is charged tokens from its client's bucket (see client_key)
+# according to the endpoint's cost, and counts
+# against its endpoint class's concurrency limit. A class is also shed
+# early when its recent latency says a new request would wait longer than
+# the class target. 429 = this client is over its rate, 503 = server busy.
+RATE_BUCKET_CAPACITY = 60.0     # burst tokens per client
+RATE_REFILL_PER_SEC = 1.0       # sustained tokens per second per client
+MAX_TRACKED_CLIENTS = 10000     # oldest idle buckets are evicted past this
+# X-API-Key values that get their own bucket (comma separated); any other key is ignored
+RATE_LIMIT_API_KEYS = {k.strip() for k in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if k.strip()}
+# peers whose X-Forwarded-For / X-Session-Id are trusted (the Streamlit server)
+TRUSTED_PROXIES = {p.strip() for p in os.getenv("TRUSTED_PROXIES", "127.0.0.1,::1").split(",") if p.strip()}
+# X-Admin-Key values accepted on /admin/*; when unset, only direct localhost calls are allowed
+ADMIN_API_KEYS = {k.strip() for k in os.getenv("ADMIN_API_KEYS", "").split(",") if k.strip()}
+LOOPBACK_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+ENDPOINT_COSTS = {
+    # path: (class, token cost)
+    "/detect_disease": ("heavy", 10),
+    "/detect_disease_compact": ("heavy", 2),
+    "/pest_alerts": ("feeds", 5),
+    "/admin/reference_index/refresh": ("heavy", 10),  # rescans the folder under the index lock
+}
+DEFAULT_ENDPOINT_COST = ("light", 1)
+
+ENDPOINT_CLASS_LIMITS = {
+    "heavy": {"max_concurrent": 4, "latency_target_s": 2.0},
+    "feeds": {"max_concurrent": 2, "latency_target_s": 10.0},
+    "light": {"max_concurrent": 64, "latency_target_s": 1.0},
+}
+
+client_buckets = OrderedDict()  # client key -> [tokens, last_refill_monotonic]
+class_state = {
+    name: {"in_flight": 0, "ewma_latency_s": 0.0, "completed": 0,
+           "rejected_rate": 0, "rejected_concurrency": 0, "rejected_latency": 0}
+    for name in ENDPOINT_CLASS_LIMITS
+}
+
+def client_key(request: Request) -> str:
+    peer = request.client.host if request.client else "unknown"
+    # only configured keys get their own bucket; unknown keys fall back to IP
+    api_key = request.headers.get("x-api-key")
+    if api_key and api_key in RATE_LIMIT_API_KEYS:
+        return f"key:{api_key}"
+    # the Streamlit app calls us for every farmer, so when the call comes from
+    # a trusted proxy, rate-limit the end user it forwards instead of the proxy
+    if peer in TRUSTED_PROXIES:
+        # each proxy appends the address it saw, so only the right end of the
+        # chain is trustworthy: the first hop that isn't one of our proxies
+        # is the client; anything left of it could be forged
+        hops = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+        for hop in reversed(hops):
+            if hop not in TRUSTED_PROXIES:
+                return f"ip:{hop}"
+        # the session id is minted by the Streamlit app and only lives as long
+        # as the browser tab: a reload starts a fresh bucket. It is a fallback
+        # for when Streamlit can't see the browser IP, not an identity.
+        session = request.headers.get("x-session-id")
+        if session:
+            return f"session:{session}"
+    return f"ip:{peer}"
+
+def require_admin(request: Request):
+    """Dependency for /admin/*: a configured X-Admin-Key, or a direct localhost call when none are configured."""
+    if ADMIN_API_KEYS:
+        if request.headers.get("x-admin-key") not in ADMIN_API_KEYS:
+            raise HTTPException(status_code=403, detail="Admin key required.")
+        return
+    peer = request.client.host if request.client else None
+    # a localhost peer relaying X-Forwarded-For is a proxy, not an operator
+    if peer not in LOOPBACK_HOSTS or "x-forwarded-for" in request.headers:
+        raise HTTPException(status_code=403, detail="Admin endpoints are localhost-only unless ADMIN_API_KEYS is set.")
+
+def take_tokens(key: str, cost: float, now: float):
+    """Charge `cost` tokens; returns 0 on success, else seconds until enough tokens."""
+    bucket = client_buckets.get(key)
+    if bucket is None:
+        bucket = client_buckets[key] = [RATE_BUCKET_CAPACITY, now]
+        if len(client_buckets) > MAX_TRACKED_CLIENTS:
+            client_buckets.popitem(last=False)
+    else:
+        client_buckets.move_to_end(key)
+        bucket[0] = min(RATE_BUCKET_CAPACITY, bucket[0] + (now - bucket[1]) * RATE_REFILL_PER_SEC)
+        bucket[1] = now
+    if bucket[0] >= cost:
+        bucket[0] -= cost
+        return 0.0
+    return (cost - bucket[0]) / RATE_REFILL_PER_SEC
+
+def rejection(status_code: int, error: str, retry_after: float):
+    retry = max(1, math.ceil(retry_after))
+    return JSONResponse(status_code=status_code, content={"error": error, "retry_after_s": retry},
+                        headers={"Retry-After": str(retry)})
+
+# ---------------- MIDDLEWARE ----------------
+# Starlette runs the last-registered middleware outermost, so requests pass
+# CORS -> limit_compact_body -> protect_expensive_endpoints -> endpoint.
+# Oversized uploads are refused (411/413) before they are charged tokens
+# or counted in flight, and every rejection still carries CORS headers.
+@app.middleware("http")
+async def add_catalogue_version(request: Request, call_next):
+    # lets clients notice a stale /catalogue copy from any response
+    response = await call_next(request)
+    response.headers["X-Catalogue-Version"] = catalogue["version"]
+    return response
+
+@app.middleware("http")
+async def protect_expensive_endpoints(request: Request, call_next):
+    # runs on the event loop only, so the counters need no locking
+    cls, cost = ENDPOINT_COSTS.get(request.url.path, DEFAULT_ENDPOINT_COST)
+    limits = ENDPOINT_CLASS_LIMITS[cls]
+    state = class_state[cls]
+
+    if state["in_flight"] >= limits["max_concurrent"]:
+        state["rejected_concurrency"] += 1
+        return rejection(503, "Server busy, please retry shortly.", state["ewma_latency_s"])
+    expected_wait = state["ewma_latency_s"] * (state["in_flight"] + 1) / limits["max_concurrent"]
+    if state["in_flight"] and expected_wait > limits["latency_target_s"]:
+        state["rejected_latency"] += 1
+        return rejection(503, "Server busy, please retry shortly.", expected_wait)
+
+    now = time.monotonic()
+    wait = take_tokens(client_key(request), cost, now)
+    if wait:
+        state["rejected_rate"] += 1
+        return rejection(429, "Too many requests, please slow down.", wait)
+
+    state["in_flight"] += 1
+    try:
+        return await call_next(request)
+    finally:
+        state["in_flight"] -= 1
+        latency = time.monotonic() - now
+        state["ewma_latency_s"] = 0.8 * state["ewma_latency_s"] + 0.2 * latency if state["completed"] else latency
+        state["completed"] += 1
+
+@app.middleware("http")
+async def limit_compact_body(request: Request, call_next):
+    # reject oversized compact uploads before the multipart body is parsed.
+    # A chunked body has no length to check up front, so it is refused; the
+    # server stops reading a body at its declared Content-Length.
+    if request.url.path == "/detect_disease_compact":
+        length = request.headers.get("content-length")
+        if not (length and length.isdigit()):
+            upload_stats["rejected_no_length"] += 1
+            return JSONResponse(status_code=411, content={"error": "Compact uploads need a Content-Length header."})
+        if int(length) > COMPACT_MAX_BODY_BYTES:
+            upload_stats["rejected_too_large"] += 1
+            return JSONResponse(status_code=413, content={"error": f"Compact upload larger than {COMPACT_MAX_BODY_BYTES} bytes."})
+    return await call_next(request)
+
+# allow Streamlit (frontend) to call backend; keep this registration last
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # allow all during dev
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    # let browser clients read caching and back-off headers
+    expose_headers=["ETag", "Retry-After", "X-Catalogue-Version"],
+)
+
 # ---------------- MODELS ----------------
 class FarmerInput(BaseModel):
     soil_type: str
@@ -165,6 +585,26 @@ class FertilizerInput(BaseModel):
 def root():
     return {"status": "backend running"}
 
+@app.get("/catalogue")
+def get_catalogue(request: Request):
+    """
+    Whole static catalogue (crops, diseases, weather tips, fertilizer) in one
+    precomputed body. Revalidate with If-None-Match to get a bodyless 304.
+    """
+    use_gzip = "gzip" in request.headers.get("accept-encoding", "").lower()
+    headers = {
+        "ETag": catalogue["etag_gzip"] if use_gzip else catalogue["etag"],
+        "Cache-Control": f"public, max-age={CATALOGUE_MAX_AGE}",
+        "Vary": "Accept-Encoding",
+    }
+    # either tag means the client holds the current catalogue
+    if etag_matches(request, catalogue["etag"], catalogue["etag_gzip"]):
+        return Response(status_code=304, headers=headers)
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=catalogue["body_gzip"], media_type="application/json", headers=headers)
+    return Response(content=catalogue["body"], media_type="application/json", headers=headers)
+
 @app.post("/recommend_crop")
 def recommend_crop(data: FarmerInput):
     soil = data.soil_type.lower()
@@ -173,16 +613,19 @@ def recommend_crop(data: FarmerInput):
     return {"error": "Soil type not found."}
 
 @app.get("/weather_tip")
-def weather_tip():
-    today = datetime.datetime.now().strftime("%A")
-    return {"day": today, "tip": weather_tips.get(today, "No tip available.")}
+def weather_tip(request: Request):
+    now = datetime.datetime.now()
+    today = now.strftime("%A")
+    payload = {"day": today, "tip": weather_tips.get(today, "No tip available.")}
+    # tip only changes at midnight, so clients can keep it until then
+    return cached_json(request, payload, max_age=seconds_until_midnight(now))
 
 # ---------------- REPLACE the /detect_disease endpoint with this implementation ----------------
 @app.post("/detect_disease")
 async def detect_disease(file: UploadFile = File(...)):
     """
-    Robust image-based disease match using color-histogram comparison.
-    Uses precomputed `ref_histograms` if available, else scans REFERENCE_DIR.
+    Robust image-based disease match using color-histogram comparison
+    against the hot-reloaded `ref_index`.
     Returns: { disease_detected, remedy, score } on success
              { error, score?, matched_key? } on failure
     """
@@ -207,63 +650,79 @@ async def detect_disease(file: UploadFile = File(...)):
     except Exception as e:
         return JSONResponse(status_code=400, content={"error": f"Error decoding image: {e}"})
 
-    # compute histogram for uploaded image
+    # compute descriptor for uploaded image
     try:
-        upload_hist = compute_histogram_cv(upload_rgb)
+        upload_hist = describe(upload_rgb)
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": f"Failed to compute histogram: {e}"})
 
-    # search best match among reference histograms
-    best_score = -1.0
-    best_key = None
-
-    # Try precomputed ref_histograms (constructed at startup) if present
-    if isinstance(ref_histograms, dict) and ref_histograms:
-        for key, ref_hist in ref_histograms.items():
-            try:
-                score = compare_histograms(upload_hist, ref_hist)
-            except Exception:
-                score = -1.0
-            if score > best_score:
-                best_score = score
-                best_key = key
-    else:
-        # fallback: scan REFERENCE_DIR image files on demand
-        if os.path.isdir(REFERENCE_DIR):
-            for fname in os.listdir(REFERENCE_DIR):
-                if not fname.lower().endswith((".jpg", ".jpeg", ".png")):
-                    continue
-                key = os.path.splitext(fname)[0].lower()
-                ref_img = read_image_cv(os.path.join(REFERENCE_DIR, fname))
-                if ref_img is None:
-                    continue
-                try:
-                    ref_hist = compute_histogram_cv(ref_img)
-                    score = compare_histograms(upload_hist, ref_hist)
-                except Exception:
-                    score = -1.0
-                if score > best_score:
-                    best_score = score
-                    best_key = key
-
-    # threshold check - adjust 0.15 if too strict/lenient
-    MIN_SCORE = 0.15
-    if best_key is None or best_score < MIN_SCORE:
-        return {"error": "No close disease match found.", "score": float(best_score)}
+    best_key, best_score = best_reference_match(upload_hist)
+    return disease_result(best_key, best_score)
 
-    # find remedy in the disease_data dictionary
-    remedy = disease_data.get(best_key)
-    if not remedy:
-        # helpful response when a match was found but no remedy recorded
-        return {
-            "error": "Matched image found but remedy missing for key.",
-            "matched_key": best_key,
-            "score": float(best_score),
-            "note": "Use /reference_list to inspect keys and /add_remedy to add remedy for this key."
-        }
+@app.post("/detect_disease_compact")
+async def detect_disease_compact(kind: str = Form(...), file: UploadFile = File(...)):
+    """
+    Low-bandwidth variant of /detect_disease.
+    kind="thumb": raw RGB bytes of a THUMB_SIZE x THUMB_SIZE thumbnail
+    kind="hist":  512 little-endian float32 bins, 8x8x8 over R,G,B (any scale)
+    Returns the same payload as /detect_disease plus `payload_bytes_est`.
+    """
+    kind = kind.lower()
+    if kind not in COMPACT_KINDS:
+        return JSONResponse(status_code=400, content={"error": f"Unknown kind '{kind}'. Use one of: {sorted(COMPACT_KINDS)}"})
+
+    size = upload_size(file)
+    if size != COMPACT_KINDS[kind]:
+        return JSONResponse(status_code=400, content={
+            "error": f"Expected {COMPACT_KINDS[kind]} bytes for kind '{kind}', got {size}."
+        })
+
+    # estimated payload memory: the spooled upload, our copy of it, and the
+    # histogram (a full decode is never needed)
+    try:
+        buf = read_upload(file, size)
+        upload_hist = histogram_from_compact(kind, buf)
+    except Exception as e:
+        return JSONResponse(status_code=400, content={"error": f"Invalid {kind} payload: {e}"})
+    payload_bytes_est = size + buf.nbytes + upload_hist.nbytes
+    upload_stats["requests"] += 1
+    upload_stats["last_payload_bytes_est"] = payload_bytes_est
+    upload_stats["max_payload_bytes_est"] = max(upload_stats["max_payload_bytes_est"], payload_bytes_est)
+
+    best_key, best_score = best_reference_match(upload_hist)
+    result = disease_result(best_key, best_score)
+    result["payload_bytes_est"] = payload_bytes_est
+    return result
+
+@app.get("/admin/reference_index", dependencies=[Depends(require_admin)])
+def reference_index_status():
+    index = ref_index
+    return {
+        **reference_index_info(index),
+        "keys": sorted(index["keys"]),
+        "unreadable": sorted(ref_failed),
+        "reference_dir": REFERENCE_DIR,
+        "descriptor": descriptor_stats,
+        "poll_seconds": REFERENCE_POLL_SECONDS,
+    }
 
-    # success
-    return {"disease_detected": best_key, "remedy": remedy, "score": float(best_score)}
+@app.post("/admin/reference_index/refresh", dependencies=[Depends(require_admin)])
+def reference_index_refresh():
+    changes = refresh_reference_index()
+    return {**reference_index_info(ref_index), "changes": changes}
+
+@app.get("/admin/load_stats", dependencies=[Depends(require_admin)])
+def load_stats():
+    return {
+        "classes": {name: {**class_state[name], **ENDPOINT_CLASS_LIMITS[name]} for name in class_state},
+        "endpoint_costs": {path: {"class": c, "cost": cost} for path, (c, cost) in ENDPOINT_COSTS.items()},
+        "rate_limit": {"capacity": RATE_BUCKET_CAPACITY, "refill_per_s": RATE_REFILL_PER_SEC},
+        "tracked_clients": len(client_buckets),
+    }
+
+@app.get("/upload_stats")
+def get_upload_stats():
+    return {**upload_stats, "max_body_bytes": COMPACT_MAX_BODY_BYTES}
 
 @app.post("/fertilizer_advice")
 def fertilizer_advice(data: FertilizerInput):